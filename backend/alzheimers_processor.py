@@ -1,15 +1,99 @@
 from typing import Dict, List, Any, Optional
+import threading
+from cachetools import TTLCache
 import numpy as np
-from datetime import datetime
+from datetime import datetime, timezone
 from rag_processor import RAGProcessor
 from longitudinal_analysis import LongitudinalAnalysis
 import logging
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
 logger = logging.getLogger(__name__)
 
+# Threshold ladders as bin edges and the risk for each bin; a value equal to
+# an edge falls in the bin above it (searchsorted with side='right')
+MMSE_BINS = np.array([24.0, 27.0])
+MMSE_SCORES = np.array([0.4, 0.2, 0.0])
+VERBAL_BINS = np.array([12.0, 15.0])
+VERBAL_SCORES = np.array([0.3, 0.15, 0.0])
+AGE_BINS = np.array([55.0, 65.0])
+AGE_SCORES = np.array([0.0, 0.15, 0.3])
+EDUCATION_BINS = np.array([12.0, 16.0])
+EDUCATION_SCORES = np.array([0.0, -0.05, -0.1])
+
+# Warning sign for each MMSE bin, looked up with the same bins as the risk score
+MMSE_WARNINGS = (
+    "Significant cognitive impairment detected in MMSE score",
+    "Mild cognitive impairment detected in MMSE score",
+    None
+)
+
+# Ordinal codes for reported symptom severity and the cognitive risk each adds
+SEVERITY_CODES = {'none': 0, 'mild': 1, 'moderate': 2, 'severe': 3}
+MEMORY_SEVERITY_SCORES = np.array([0.0, 0.1, 0.2, 0.3])
+
+# Cosine similarity above which a cached answer is reused for a new query
+SEMANTIC_CACHE_THRESHOLD = 0.85
+SEMANTIC_CACHE_SIZE = 256
+INSIGHTS_CACHE_SIZE = 1024
+# Seconds a cached insight is served; bounds staleness in workers that
+# did not handle the write that changed the vector store
+INSIGHTS_CACHE_TTL = 60
+
+# Most recent assessments kept per patient for longitudinal analysis
+PATIENT_HISTORY_LIMIT = 20
+# Seconds a patient's history is cached; kept short because other workers
+# may store new assessments for the same patient
+PATIENT_HISTORY_CACHE_TTL = 5
+
+# Risk added by APOE genotype code (0: no e4 allele, 1: e4, 2: e4/e4)
+APOE_SCORES = np.array([0.0, 0.3, 0.5])
+
+# Recommendation tiers per risk type as (threshold, messages), highest first
+RECOMMENDATION_RULES = (
+    # High overall risk recommendations
+    ('overall_risk', (
+        (0.7, (
+            "Immediate consultation with a neurologist recommended",
+            "Consider comprehensive neuropsychological testing",
+            "Regular cognitive monitoring advised"
+        )),
+        (0.4, (
+            "Schedule follow-up cognitive assessments",
+            "Consider lifestyle modifications",
+            "Monitor cognitive changes closely"
+        ))
+    )),
+    # Cognitive-specific recommendations
+    ('cognitive_risk', (
+        (0.6, (
+            "Engage in cognitive stimulation activities",
+            "Consider cognitive rehabilitation programs",
+            "Regular memory exercises recommended"
+        )),
+    )),
+    # Lifestyle recommendations
+    ('lifestyle_risk', (
+        (0.5, (
+            "Increase physical activity levels",
+            "Maintain social engagement",
+            "Consider Mediterranean diet adoption",
+            "Regular cardiovascular health check-ups"
+        )),
+    ))
+)
+
 class AlzheimersProcessor:
-    def __init__(self):
+    def __init__(self, collection=None):
         self.rag = RAGProcessor()
+        self.collection = collection
+        self._history_cache = TTLCache(maxsize=10_000, ttl=PATIENT_HISTORY_CACHE_TTL)
+        self._history_cache_lock = threading.Lock()
         self.longitudinal = LongitudinalAnalysis()
         self.risk_factors = {
             'age': {'weight': 0.2, 'high_risk': 65},
@@ -20,33 +104,36 @@ class AlzheimersProcessor:
             'education': {'weight': 0.1, 'high_risk': False}
         }
 
+        # Query caches keyed by (query, top_k); the semantic cache also keeps
+        # the query embedding. The generation guards against storing results
+        # fetched before an invalidation.
+        self._insights_cache = TTLCache(maxsize=INSIGHTS_CACHE_SIZE, ttl=INSIGHTS_CACHE_TTL)
+        self._semantic_cache = TTLCache(maxsize=SEMANTIC_CACHE_SIZE, ttl=INSIGHTS_CACHE_TTL)
+        self._insights_generation = 0
+        self._insights_lock = threading.Lock()
+
     def process_patient_data(self, data: Dict[str, Any]) -> Dict[str, Any]:
         try:
+            # One naive UTC timestamp for both the record and its processing time
+            now = datetime.now(timezone.utc).replace(tzinfo=None).isoformat()
+
             # Add timestamp if not present
             if 'timestamp' not in data:
-                data['timestamp'] = datetime.utcnow().isoformat()
-
-            # Extract patient data
-            demographics = data.get('patient_data', {}).get('demographics', {})
-            cognitive = data.get('patient_data', {}).get('cognitive_tests', {})
-            medical = data.get('patient_data', {}).get('medical_history', {})
-            symptoms = data.get('patient_data', {}).get('symptoms', {})
-            biomarkers = data.get('patient_data', {}).get('biomarkers', {})
+                data['timestamp'] = now
 
             # Calculate risk scores
-            risk_assessment = self._calculate_risk_scores(
-                demographics, cognitive, medical, symptoms, biomarkers
-            )
+            risk_assessment = self._calculate_risk_scores(data)
 
             # Add risk assessment to data
             enriched_data = {
                 **data,
                 'risk_assessment': risk_assessment,
-                'processed_timestamp': datetime.utcnow().isoformat()
+                'processed_timestamp': now
             }
 
             # Get patient history
             patient_history = self._get_patient_history(data)
+            self._remember_assessment(data, enriched_data, patient_history)
             
             # Perform longitudinal analysis if history exists
             if patient_history:
@@ -56,6 +143,7 @@ class AlzheimersProcessor:
 
             # Store in RAG system
             self.rag.process_health_data(enriched_data)
+            self.invalidate_insights_cache()
 
             return enriched_data
 
@@ -64,131 +152,129 @@ class AlzheimersProcessor:
 
     def _get_patient_history(self, current_data: Dict[str, Any]) -> List[Dict[str, Any]]:
         """Retrieve patient's historical data"""
-        try:
-            # This would typically query your MongoDB collection
-            # For now, returning empty list - implement actual DB query
+        patient_id = current_data.get('patient_id')
+        if patient_id is None or self.collection is None:
             return []
+
+        try:
+            with self._history_cache_lock:
+                history = self._history_cache.get(patient_id)
+            if history is None:
+                history = list(
+                    self.collection.find({'patient_id': patient_id})
+                    .sort('processed_timestamp', -1)
+                    .limit(PATIENT_HISTORY_LIMIT)
+                )
+                with self._history_cache_lock:
+                    self._history_cache[patient_id] = history
+            # Copy so callers can append without touching the cached list
+            return list(history)
         except Exception as e:
             logger.error(f"Error retrieving patient history: {str(e)}")
             return []
 
-    def _calculate_risk_scores(
+    def _remember_assessment(
         self,
-        demographics: Dict,
-        cognitive: Dict,
-        medical: Dict,
-        symptoms: Dict,
-        biomarkers: Dict
-    ) -> Dict[str, Any]:
+        current_data: Dict[str, Any],
+        enriched_data: Dict[str, Any],
+        patient_history: List[Dict[str, Any]]
+    ) -> None:
+        """Keep the cached history current with the assessment being stored"""
+        patient_id = current_data.get('patient_id')
+        if patient_id is not None and self.collection is not None:
+            with self._history_cache_lock:
+                self._history_cache[patient_id] = [enriched_data] + patient_history[:PATIENT_HISTORY_LIMIT - 1]
+
+    def _calculate_risk_scores(self, data: Dict[str, Any]) -> Dict[str, Any]:
         """Calculate various risk scores based on patient data"""
-        
-        risk_scores = {
-            'overall_risk': 0.0,
-            'cognitive_risk': self._assess_cognitive_risk(cognitive, symptoms),
-            'genetic_risk': self._assess_genetic_risk(biomarkers, medical),
-            'lifestyle_risk': self._assess_lifestyle_risk(demographics, medical),
-            'warning_signs': self._identify_warning_signs(cognitive, symptoms),
-            'recommendations': []
-        }
-
-        # Calculate overall risk
-        risk_scores['overall_risk'] = (
-            risk_scores['cognitive_risk'] * 0.4 +
-            risk_scores['genetic_risk'] * 0.3 +
-            risk_scores['lifestyle_risk'] * 0.3
+        return self.assess_patient_batch([data])[0]
+
+    def assess_patient_batch(self, records: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Build risk assessments for a batch of patient records"""
+        scores = self._calculate_risk_scores_batch(records)
+
+        assessments = []
+        for record, (cognitive_risk, genetic_risk, lifestyle_risk, overall_risk) in zip(records, scores.tolist()):
+            patient_data = record.get('patient_data', {})
+            risk_scores = {
+                'overall_risk': overall_risk,
+                'cognitive_risk': cognitive_risk,
+                'genetic_risk': genetic_risk,
+                'lifestyle_risk': lifestyle_risk,
+                'warning_signs': self._identify_warning_signs(
+                    patient_data.get('cognitive_tests', {}),
+                    patient_data.get('symptoms', {})
+                ),
+                'recommendations': []
+            }
+            risk_scores['recommendations'] = self._generate_recommendations(risk_scores)
+            assessments.append(risk_scores)
+
+        return assessments
+
+    def _calculate_risk_scores_batch(self, records: List[Dict[str, Any]]) -> np.ndarray:
+        """Calculate risk scores for many patients in a single vectorized pass.
+
+        Returns an (N, 4) array whose columns are cognitive, genetic, lifestyle
+        and overall risk.
+        """
+        n = len(records)
+        patients = [record.get('patient_data', {}) for record in records]
+        demographics = [p.get('demographics', {}) for p in patients]
+        cognitive = [p.get('cognitive_tests', {}) for p in patients]
+        medical = [p.get('medical_history', {}) for p in patients]
+        symptoms = [p.get('symptoms', {}) for p in patients]
+        biomarkers = [p.get('biomarkers', {}) for p in patients]
+
+        # Extract one column per field
+        mmse = np.fromiter(
+            (_as_float(c.get('mmse_score'), 30.0) for c in cognitive),
+            dtype=np.float64, count=n
+        )
+        verbal = np.fromiter(
+            (_as_float(c.get('verbal_fluency'), 0.0) for c in cognitive),
+            dtype=np.float64, count=n
+        )
+        memory = np.fromiter(
+            (SEVERITY_CODES.get(s.get('memory_issues', 'none'), 0) for s in symptoms),
+            dtype=np.int8, count=n
+        )
+        age = np.fromiter((_as_float(d.get('age'), 0.0) for d in demographics), dtype=np.float64, count=n)
+        education = np.fromiter(
+            (_as_float(d.get('education_years'), 0.0) for d in demographics),
+            dtype=np.float64, count=n
+        )
+        apoe = np.fromiter(
+            (_apoe_code(b.get('apoe_genotype', '')) for b in biomarkers),
+            dtype=np.int8, count=n
+        )
+        family_history = np.fromiter(
+            (m.get('family_history_alzheimers', '').lower() == 'yes' for m in medical),
+            dtype=bool, count=n
+        )
+        amyloid = np.fromiter(
+            (b.get('blood_markers', {}).get('beta_amyloid', '').lower() == 'elevated' for b in biomarkers),
+            dtype=bool, count=n
+        )
+        cardio = np.fromiter(
+            (_has_cardiovascular_condition(m.get('cardiovascular_conditions', '')) for m in medical),
+            dtype=bool, count=n
         )
 
-        # Generate recommendations
-        risk_scores['recommendations'] = self._generate_recommendations(risk_scores)
-
-        return risk_scores
-
-    def _assess_cognitive_risk(self, cognitive: Dict, symptoms: Dict) -> float:
-        """Assess cognitive risk based on test scores and symptoms"""
-        risk_score = 0.0
-        
-        # MMSE Score analysis (30 is max score)
-        mmse = float(cognitive.get('mmse_score', '30').split()[0])
-        if mmse < 24:
-            risk_score += 0.4
-        elif mmse < 27:
-            risk_score += 0.2
-
-        # Verbal fluency analysis
-        verbal = float(cognitive.get('verbal_fluency', '0').split()[0])
-        if verbal < 12:
-            risk_score += 0.3
-        elif verbal < 15:
-            risk_score += 0.15
-
-        # Symptom analysis
-        memory_issues = symptoms.get('memory_issues', 'none')
-        if memory_issues == 'severe':
-            risk_score += 0.3
-        elif memory_issues == 'moderate':
-            risk_score += 0.2
-        elif memory_issues == 'mild':
-            risk_score += 0.1
-
-        return min(risk_score, 1.0)
-
-    def _assess_genetic_risk(self, biomarkers: Dict, medical: Dict) -> float:
-        """Assess genetic risk based on biomarkers and family history"""
-        risk_score = 0.0
-
-        # APOE genotype analysis
-        apoe = biomarkers.get('apoe_genotype', '').lower()
-        if 'e4/e4' in apoe:
-            risk_score += 0.5
-        elif 'e4' in apoe:
-            risk_score += 0.3
-
-        # Family history analysis
-        if medical.get('family_history_alzheimers', '').lower() == 'yes':
-            risk_score += 0.3
-
-        # Blood markers analysis
-        blood_markers = biomarkers.get('blood_markers', {})
-        if blood_markers.get('beta_amyloid', '').lower() == 'elevated':
-            risk_score += 0.2
-
-        return min(risk_score, 1.0)
-
-    def _assess_lifestyle_risk(self, demographics: Dict, medical: Dict) -> float:
-        """Assess lifestyle and demographic risk factors"""
-        risk_score = 0.0
-
-        # Age analysis
-        age = int(demographics.get('age', '0'))
-        if age >= 65:
-            risk_score += 0.3
-        elif age >= 55:
-            risk_score += 0.15
-
-        # Education (protective factor)
-        education = int(demographics.get('education_years', '0'))
-        if education >= 16:
-            risk_score -= 0.1
-        elif education >= 12:
-            risk_score -= 0.05
-
-        # Cardiovascular conditions
-        cardio = medical.get('cardiovascular_conditions', '').lower()
-        if 'hypertension' in cardio or 'heart disease' in cardio:
-            risk_score += 0.2
-
-        return min(max(risk_score, 0.0), 1.0)
+        return _score_kernel(
+            mmse, verbal, memory, age, education,
+            apoe, family_history, amyloid, cardio
+        )
 
     def _identify_warning_signs(self, cognitive: Dict, symptoms: Dict) -> List[str]:
         """Identify specific warning signs from cognitive tests and symptoms"""
         warnings = []
 
         # Cognitive test warnings
-        mmse = float(cognitive.get('mmse_score', '30').split()[0])
-        if mmse < 24:
-            warnings.append("Significant cognitive impairment detected in MMSE score")
-        elif mmse < 27:
-            warnings.append("Mild cognitive impairment detected in MMSE score")
+        mmse = _as_float(cognitive.get('mmse_score'), 30.0)
+        mmse_warning = MMSE_WARNINGS[np.searchsorted(MMSE_BINS, mmse, side='right')]
+        if mmse_warning:
+            warnings.append(mmse_warning)
 
         # Symptom-based warnings
         memory = symptoms.get('memory_issues', 'none').lower()
@@ -211,39 +297,151 @@ class AlzheimersProcessor:
         """Generate personalized recommendations based on risk assessment"""
         recommendations = []
 
-        # High overall risk recommendations
-        if risk_scores['overall_risk'] > 0.7:
-            recommendations.extend([
-                "Immediate consultation with a neurologist recommended",
-                "Consider comprehensive neuropsychological testing",
-                "Regular cognitive monitoring advised"
-            ])
-        elif risk_scores['overall_risk'] > 0.4:
-            recommendations.extend([
-                "Schedule follow-up cognitive assessments",
-                "Consider lifestyle modifications",
-                "Monitor cognitive changes closely"
-            ])
-
-        # Cognitive-specific recommendations
-        if risk_scores['cognitive_risk'] > 0.6:
-            recommendations.extend([
-                "Engage in cognitive stimulation activities",
-                "Consider cognitive rehabilitation programs",
-                "Regular memory exercises recommended"
-            ])
-
-        # Lifestyle recommendations
-        if risk_scores['lifestyle_risk'] > 0.5:
-            recommendations.extend([
-                "Increase physical activity levels",
-                "Maintain social engagement",
-                "Consider Mediterranean diet adoption",
-                "Regular cardiovascular health check-ups"
-            ])
+        # Within each risk type only the highest tier that applies is used
+        for risk_type, tiers in RECOMMENDATION_RULES:
+            for threshold, messages in tiers:
+                if risk_scores[risk_type] > threshold:
+                    recommendations.extend(messages)
+                    break
 
         return recommendations
 
     def query_patient_insights(self, query: str, top_k: int = 3) -> List[Dict]:
-        """Query the RAG system for patient insights"""
-        return self.rag.retrieve_similar(query, top_k)
+        """Query the RAG system for patient insights, reusing results for equivalent queries"""
+        key = (query, top_k)
+        with self._insights_lock:
+            cached = self._insights_cache.get(key)
+            generation = self._insights_generation
+        if cached is not None:
+            return cached
+
+        query_embedding = self.rag.embed_query(query)
+        results = self._semantic_lookup(query_embedding, top_k)
+        semantic_hit = results is not None
+        if not semantic_hit:
+            results = self.rag.retrieve_similar_by_embedding(query_embedding, top_k)
+
+        # Empty results may come from a transient retrieval error, so they aren't cached
+        if results:
+            with self._insights_lock:
+                if generation == self._insights_generation:
+                    self._insights_cache[key] = results
+                    if not semantic_hit:
+                        self._semantic_cache[key] = (query_embedding, results)
+        return results
+
+    def invalidate_insights_cache(self) -> None:
+        """Drop cached query results after the vector store changes"""
+        with self._insights_lock:
+            self._insights_generation += 1
+            self._insights_cache.clear()
+            self._semantic_cache.clear()
+
+    def _semantic_lookup(self, query_embedding: np.ndarray, top_k: int) -> Optional[List[Dict]]:
+        """Find cached results for the most similar previous query, if close enough"""
+        with self._insights_lock, self._semantic_cache.timer:
+            entries = [entry for (_, k), entry in self._semantic_cache.items() if k == top_k]
+        if not entries:
+            return None
+
+        embeddings = np.array([entry[0] for entry in entries])
+        similarities = embeddings @ query_embedding / (
+            np.linalg.norm(embeddings, axis=1) * np.linalg.norm(query_embedding)
+        )
+        best = int(np.argmax(similarities))
+        if similarities[best] >= SEMANTIC_CACHE_THRESHOLD:
+            return entries[best][1]
+        return None
+
+def _as_float(value: Any, default: float) -> float:
+    """Read a numeric field sent either as a number or as a string like '24 points'"""
+    if isinstance(value, (int, float)):
+        return float(value)
+    if value is None:
+        return default
+    parts = str(value).split()
+    return float(parts[0]) if parts else default
+
+
+def _apoe_code(genotype: str) -> int:
+    """Encode an APOE genotype string as 0 (no e4), 1 (e4) or 2 (e4/e4)"""
+    genotype = genotype.lower()
+    if 'e4/e4' in genotype:
+        return 2
+    if 'e4' in genotype:
+        return 1
+    return 0
+
+
+def _has_cardiovascular_condition(conditions: str) -> bool:
+    """Check for cardiovascular conditions that raise lifestyle risk"""
+    conditions = conditions.lower()
+    return 'hypertension' in conditions or 'heart disease' in conditions
+
+
+def _score_columns(mmse, verbal, memory, age, education, apoe, family_history, amyloid, cardio):
+    """Score encoded patient columns with NumPy array expressions"""
+    cognitive_risk = np.minimum(
+        MMSE_SCORES[np.searchsorted(MMSE_BINS, mmse, side='right')] +
+        VERBAL_SCORES[np.searchsorted(VERBAL_BINS, verbal, side='right')] +
+        MEMORY_SEVERITY_SCORES[memory],
+        1.0
+    )
+    genetic_risk = np.minimum(
+        APOE_SCORES[apoe] + 0.3 * family_history + 0.2 * amyloid,
+        1.0
+    )
+    lifestyle_risk = np.clip(
+        AGE_SCORES[np.searchsorted(AGE_BINS, age, side='right')] +
+        EDUCATION_SCORES[np.searchsorted(EDUCATION_BINS, education, side='right')] +
+        0.2 * cardio,
+        0.0, 1.0
+    )
+    overall_risk = cognitive_risk * 0.4 + genetic_risk * 0.3 + lifestyle_risk * 0.3
+
+    return np.column_stack((cognitive_risk, genetic_risk, lifestyle_risk, overall_risk))
+
+
+if NUMBA_AVAILABLE:
+    # Serial on purpose: a batch is one upload's files, and request threads
+    # calling a parallel kernel concurrently can abort the workqueue layer
+    @njit(cache=True)
+    def _score_kernel(mmse, verbal, memory, age, education, apoe, family_history, amyloid, cardio):
+        """Score encoded patient columns in a compiled loop"""
+        n = mmse.shape[0]
+        scores = np.empty((n, 4))
+        for i in range(n):
+            cognitive_risk = min(
+                MMSE_SCORES[np.searchsorted(MMSE_BINS, mmse[i], side='right')] +
+                VERBAL_SCORES[np.searchsorted(VERBAL_BINS, verbal[i], side='right')] +
+                MEMORY_SEVERITY_SCORES[memory[i]],
+                1.0
+            )
+
+            genetic_risk = min(
+                APOE_SCORES[apoe[i]] + 0.3 * family_history[i] + 0.2 * amyloid[i],
+                1.0
+            )
+
+            lifestyle_risk = min(max(
+                AGE_SCORES[np.searchsorted(AGE_BINS, age[i], side='right')] +
+                EDUCATION_SCORES[np.searchsorted(EDUCATION_BINS, education[i], side='right')] +
+                0.2 * cardio[i],
+                0.0
+            ), 1.0)
+
+            scores[i, 0] = cognitive_risk
+            scores[i, 1] = genetic_risk
+            scores[i, 2] = lifestyle_risk
+            scores[i, 3] = cognitive_risk * 0.4 + genetic_risk * 0.3 + lifestyle_risk * 0.3
+        return scores
+
+    # Compile at import so the first request doesn't pay the JIT cost
+    _score_kernel(
+        np.empty(0, dtype=np.float64), np.empty(0, dtype=np.float64),
+        np.empty(0, dtype=np.int8), np.empty(0, dtype=np.float64),
+        np.empty(0, dtype=np.float64), np.empty(0, dtype=np.int8),
+        np.empty(0, dtype=bool), np.empty(0, dtype=bool), np.empty(0, dtype=bool)
+    )
+else:
+    _score_kernel = _score_columns
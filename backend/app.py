@@ -1,18 +1,23 @@
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
 from pymongo import MongoClient
+from pymongo.errors import BulkWriteError, PyMongoError
 import logging
-from datetime import datetime
+from datetime import datetime, timezone
 from dotenv import load_dotenv
 import os
-import json
-import pandas as pd
-from openpyxl import load_workbook
+import orjson
 import io
-import csv
 import re
+from importlib.util import find_spec
 from alzheimers_processor import AlzheimersProcessor
 
+# Prefer the streaming Rust/Arrow readers for tabular uploads when installed;
+# checked without importing so startup doesn't pay for them
+EXCEL_ENGINE = 'calamine' if find_spec('python_calamine') else 'openpyxl'
+CSV_ENGINE = 'pyarrow' if find_spec('pyarrow') else 'c'
+
 # Configure logging
 logging.basicConfig(level=logging.DEBUG)
 logger = logging.getLogger(__name__)
@@ -20,7 +25,17 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+class OrjsonProvider(JSONProvider):
+    """Flask JSON provider backed by orjson for request parsing and responses"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app, resources={
     r"/api/*": {
         "origins": "*",
@@ -29,8 +44,63 @@ CORS(app, resources={
     }
 })
 
-# Initialize processors
-alzheimers_processor = AlzheimersProcessor()
+# Comprehensive mapping of tabular column names to standardized fields
+TABULAR_COLUMN_MAP = {
+    # Blood Pressure
+    'blood pressure systolic': 'bloodPressure.systolic',
+    'bp systolic': 'bloodPressure.systolic',
+    'systolic': 'bloodPressure.systolic',
+    'blood pressure diastolic': 'bloodPressure.diastolic',
+    'bp diastolic': 'bloodPressure.diastolic',
+    'diastolic': 'bloodPressure.diastolic',
+    
+    # Oxygen Saturation
+    'oxygen saturation': 'oxygenSaturation',
+    'o2 saturation': 'oxygenSaturation',
+    'spo2': 'oxygenSaturation',
+    'oxygen': 'oxygenSaturation',
+    
+    # Pulse Rate
+    'pulse rate': 'pulseRate',
+    'pulse': 'pulseRate',
+    'heart rate': 'pulseRate',
+    
+    # Sleep
+    'sleep duration': 'sleepDuration',
+    'sleep duration hours': 'sleepDuration',
+    'sleep hours': 'sleepDuration',
+    'sleep quality': 'sleepQuality',
+    'quality of sleep': 'sleepQuality',
+    
+    # Temperature
+    'temperature': 'temperature',
+    'temp': 'temperature',
+    'body temperature': 'temperature',
+    
+    # Notes
+    'mri notes': 'mri.notes',
+    'mri': 'mri.notes',
+    'additional notes': 'additionalNotes',
+    'notes': 'additionalNotes'
+}
+
+# Standardized columns extracted from tabular uploads, in record order
+TABULAR_COLUMNS = [
+    'bloodPressure.systolic',
+    'bloodPressure.diastolic',
+    'oxygenSaturation',
+    'pulseRate',
+    'sleepDuration',
+    'sleepQuality',
+    'temperature',
+    'mri.notes',
+    'additionalNotes'
+]
+
+# Patterns for extracting structured fields from free-text uploads
+HEART_RATE_RE = re.compile(rb'heart rate:?\s*(\d+)', re.IGNORECASE)
+BLOOD_PRESSURE_RE = re.compile(rb'blood pressure:?\s*(\d+)\s*/\s*(\d+)', re.IGNORECASE)
+MRI_NOTES_RE = re.compile(rb'mri:?\s*(.+?)(?=\n\n|\Z)', re.IGNORECASE | re.DOTALL)
 
 def get_database_connection():
     uri = os.getenv('MONGODB_URI')
@@ -48,7 +118,8 @@ def get_database_connection():
         client = MongoClient(
             uri,
             serverSelectionTimeoutMS=5000,
-            appName='Health_Framework'  # Add your project name
+            appName='Health_Framework',  # Add your project name
+            compressors='zstd,zlib'
         )
         
         # Test connection
@@ -68,6 +139,10 @@ try:
     # Use the correct database name
     db = mongo_client['Health_Framework']
     collection = db['Health_Data']
+
+    # Indexes for patient history lookups (create_index is idempotent)
+    collection.create_index([('patient_id', 1), ('processed_timestamp', -1)], background=True)
+    collection.create_index([('user_id', 1), ('timestamp', -1)], background=True)
     
     # Verify database access
     logger.info(f"Connected to database: {db.name}")
@@ -77,6 +152,9 @@ except Exception as e:
     logger.error(f"Startup error: {str(e)}")
     raise
 
+# Initialize processors
+alzheimers_processor = AlzheimersProcessor(collection)
+
 @app.route('/api/test-connection', methods=['GET'])
 def test_connection():
     try:
@@ -162,6 +240,7 @@ def handle_batch_upload():
             }), 400
 
         results = []
+        parsed = []
         for file in files.values():
             try:
                 # Get file extension
@@ -174,22 +253,55 @@ def handle_batch_upload():
                 elif file_ext == '.csv':
                     data = process_csv_file(file)
                 elif file_ext == '.json':
-                    content = file.read().decode('utf-8')
-                    data = json.loads(content)
+                    data = orjson.loads(file.read())
                 else:
                     # Try to process as text
                     data = process_text_file(file)
 
-                # Validate and standardize data
-                processed_data = standardize_health_data(data, filename)
-                
-                # Insert into MongoDB
-                result = collection.insert_one(processed_data)
+                parsed.append((filename, data))
+
+            except Exception as e:
+                logger.error(f"Error processing file {filename}: {str(e)}")
                 results.append({
                     'filename': filename,
-                    'id': str(result.inserted_id)
+                    'error': str(e)
                 })
 
+        # Score all Alzheimer's patient records in a single batch
+        risk_assessments = {}
+        patient_indices = [
+            i for i, (_, data) in enumerate(parsed)
+            if isinstance(data, dict) and 'patient_data' in data
+        ]
+        if patient_indices:
+            try:
+                assessments = alzheimers_processor.assess_patient_batch(
+                    [parsed[i][1] for i in patient_indices]
+                )
+                risk_assessments = dict(zip(patient_indices, assessments))
+            except Exception as e:
+                logger.error(f"Error scoring patient batch: {str(e)}")
+                # Score records one at a time so a single bad record
+                # doesn't leave the rest of the upload unassessed
+                for i in patient_indices:
+                    try:
+                        risk_assessments[i] = alzheimers_processor.assess_patient_batch([parsed[i][1]])[0]
+                    except Exception as e:
+                        logger.error(f"Error scoring patient record {parsed[i][0]}: {str(e)}")
+
+        # Every file in the batch shares one upload time
+        upload_date = datetime.now(timezone.utc).replace(tzinfo=None)
+        docs = []
+        doc_filenames = []
+        for i, (filename, data) in enumerate(parsed):
+            try:
+                # Validate and standardize data
+                processed_data = standardize_health_data(data, filename, upload_date)
+                if i in risk_assessments:
+                    processed_data['risk_assessment'] = risk_assessments[i]
+                docs.append(processed_data)
+                doc_filenames.append(filename)
+
             except Exception as e:
                 logger.error(f"Error processing file {filename}: {str(e)}")
                 results.append({
@@ -197,6 +309,34 @@ def handle_batch_upload():
                     'error': str(e)
                 })
 
+        # Insert into MongoDB in a single unordered bulk write
+        if docs:
+            write_errors = {}
+            try:
+                collection.insert_many(docs, ordered=False)
+            except BulkWriteError as e:
+                write_errors = {
+                    error['index']: error['errmsg']
+                    for error in e.details.get('writeErrors', [])
+                }
+            except PyMongoError as e:
+                # Which documents were written is unknown, so report each as failed
+                write_errors = {index: str(e) for index in range(len(docs))}
+
+            # insert_many assigns each document its _id before writing
+            for index, (filename, doc) in enumerate(zip(doc_filenames, docs)):
+                if index in write_errors:
+                    logger.error(f"Error inserting file {filename}: {write_errors[index]}")
+                    results.append({
+                        'filename': filename,
+                        'error': write_errors[index]
+                    })
+                else:
+                    results.append({
+                        'filename': filename,
+                        'id': str(doc['_id'])
+                    })
+
         successful = len([r for r in results if 'id' in r])
         failed = len([r for r in results if 'error' in r])
         
@@ -215,103 +355,62 @@ def handle_batch_upload():
 
 def process_excel_file(file):
     """Process Excel files and convert to standardized format"""
+    import pandas as pd
+
+    logger.debug(f"Starting to process Excel file")
+    df = pd.read_excel(file, engine=EXCEL_ENGINE)
+    logger.debug(f"Excel data read successfully. Columns: {df.columns.tolist()}")
+    return process_tabular_data(df)
+
+def process_csv_file(file):
+    """Process CSV files and convert to standardized format"""
+    import pandas as pd
+
+    df = pd.read_csv(io.BytesIO(file.read()), engine=CSV_ENGINE)
+    return process_tabular_data(df)
+
+def process_tabular_data(df):
+    """Convert a parsed Excel/CSV DataFrame to standardized records"""
     try:
-        logger.debug(f"Starting to process Excel file")
-        # Read Excel file
-        df = pd.read_excel(file)
-        logger.debug(f"Excel data read successfully. Columns: {df.columns.tolist()}")
-        
-        # Convert column names to lowercase for consistency
-        df.columns = df.columns.str.lower()
-        
-        # Comprehensive mapping of column names
-        column_mapping = {
-            # Blood Pressure
-            'blood pressure systolic': 'bloodPressure.systolic',
-            'bp systolic': 'bloodPressure.systolic',
-            'systolic': 'bloodPressure.systolic',
-            'blood pressure diastolic': 'bloodPressure.diastolic',
-            'bp diastolic': 'bloodPressure.diastolic',
-            'diastolic': 'bloodPressure.diastolic',
-            
-            # Oxygen Saturation
-            'oxygen saturation': 'oxygenSaturation',
-            'o2 saturation': 'oxygenSaturation',
-            'spo2': 'oxygenSaturation',
-            'oxygen': 'oxygenSaturation',
-            
-            # Pulse Rate
-            'pulse rate': 'pulseRate',
-            'pulse': 'pulseRate',
-            'heart rate': 'pulseRate',
-            
-            # Sleep
-            'sleep duration': 'sleepDuration',
-            'sleep duration hours': 'sleepDuration',
-            'sleep hours': 'sleepDuration',
-            'sleep quality': 'sleepQuality',
-            'quality of sleep': 'sleepQuality',
-            
-            # Temperature
-            'temperature': 'temperature',
-            'temp': 'temperature',
-            'body temperature': 'temperature',
-            
-            # Notes
-            'mri notes': 'mri.notes',
-            'mri': 'mri.notes',
-            'additional notes': 'additionalNotes',
-            'notes': 'additionalNotes'
-        }
+        # Normalize column names for consistency
+        df.columns = df.columns.str.lower().str.strip()
         
         # Log original columns
         logger.debug(f"Original columns: {df.columns.tolist()}")
         
         # Rename columns based on mapping
-        df = df.rename(columns=column_mapping)
+        df = df.rename(columns=TABULAR_COLUMN_MAP)
         logger.debug(f"Columns after mapping: {df.columns.tolist()}")
         
-        # Convert to dictionary
-        records = df.to_dict('records')
-        logger.debug(f"Converted to {len(records)} records")
+        # Align to the expected columns; missing ones are filled with NaN
+        df = df.loc[:, ~df.columns.duplicated()]
+        df = df.reindex(columns=TABULAR_COLUMNS)
+        df['mri.notes'] = df['mri.notes'].fillna('')
+        df['additionalNotes'] = df['additionalNotes'].fillna('')
+        df = df.astype(object).where(df.notna(), None)
+        logger.debug(f"Converted to {len(df)} records")
         
-        # Process each record to ensure proper structure
-        processed_records = []
-        for record in records:
-            processed_record = {
+        # Build the nested record structure from whole columns
+        processed_records = [
+            {
                 'bloodPressure': {
-                    'systolic': None,
-                    'diastolic': None
+                    'systolic': systolic,
+                    'diastolic': diastolic
                 },
-                'oxygenSaturation': None,
-                'pulseRate': None,
-                'sleepDuration': None,
-                'sleepQuality': None,
-                'temperature': None,
+                'oxygenSaturation': oxygen,
+                'pulseRate': pulse,
+                'sleepDuration': sleep_duration,
+                'sleepQuality': sleep_quality,
+                'temperature': temperature,
                 'mri': {
-                    'notes': ''
+                    'notes': mri_notes
                 },
-                'additionalNotes': ''
+                'additionalNotes': notes
             }
-            
-            # Update blood pressure
-            if 'bloodPressure.systolic' in record:
-                processed_record['bloodPressure']['systolic'] = record['bloodPressure.systolic']
-            if 'bloodPressure.diastolic' in record:
-                processed_record['bloodPressure']['diastolic'] = record['bloodPressure.diastolic']
-                
-            # Update other fields
-            for field in ['oxygenSaturation', 'pulseRate', 'sleepDuration', 'sleepQuality', 'temperature']:
-                if field in record:
-                    processed_record[field] = record[field]
-                    
-            # Update notes
-            if 'mri.notes' in record:
-                processed_record['mri']['notes'] = record['mri.notes']
-            if 'additionalNotes' in record:
-                processed_record['additionalNotes'] = record['additionalNotes']
-                
-            processed_records.append(processed_record)
+            for (systolic, diastolic, oxygen, pulse, sleep_duration,
+                 sleep_quality, temperature, mri_notes, notes)
+            in zip(*(df[column].tolist() for column in TABULAR_COLUMNS))
+        ]
         
         # Return first record if single row, otherwise return all records
         result = processed_records[0] if len(processed_records) == 1 else processed_records
@@ -319,18 +418,12 @@ def process_excel_file(file):
         return result
         
     except Exception as e:
-        logger.error(f"Error processing Excel file: {str(e)}")
+        logger.error(f"Error processing tabular data: {str(e)}")
         raise
 
-def process_csv_file(file):
-    """Process CSV files and convert to standardized format"""
-    content = file.read().decode('utf-8')
-    df = pd.read_csv(io.StringIO(content))
-    return process_excel_file(df)  # Reuse Excel processing logic
-
 def process_text_file(file):
     """Process text files and attempt to extract structured data"""
-    content = file.read().decode('utf-8')
+    content = file.read()
     
     # Initialize empty data structure
     data = {
@@ -342,34 +435,37 @@ def process_text_file(file):
         'mri': {
             'notes': ''
         },
-        'additionalNotes': content  # Store full content as additional notes
+        'additionalNotes': content.decode('utf-8')  # Store full content as additional notes
     }
     
     # Try to extract structured data from text
     try:
         # Look for heart rate
-        hr_match = re.search(r'heart rate:?\s*(\d+)', content.lower())
+        hr_match = HEART_RATE_RE.search(content)
         if hr_match:
             data['heartRate'] = int(hr_match.group(1))
         
         # Look for blood pressure
-        bp_match = re.search(r'blood pressure:?\s*(\d+)\s*/\s*(\d+)', content.lower())
+        bp_match = BLOOD_PRESSURE_RE.search(content)
         if bp_match:
             data['bloodPressure']['systolic'] = int(bp_match.group(1))
             data['bloodPressure']['diastolic'] = int(bp_match.group(2))
         
         # Look for MRI notes
-        mri_match = re.search(r'mri:?\s*(.+?)(?=\n\n|\Z)', content, re.IGNORECASE | re.DOTALL)
+        mri_match = MRI_NOTES_RE.search(content)
         if mri_match:
-            data['mri']['notes'] = mri_match.group(1).strip()
+            data['mri']['notes'] = mri_match.group(1).decode('utf-8').strip()
             
     except Exception as e:
         logger.warning(f"Error extracting structured data from text: {str(e)}")
     
     return data
 
-def standardize_health_data(data, filename):
+def standardize_health_data(data, filename, upload_date=None):
     """Standardize data format and add metadata"""
+    if upload_date is None:
+        upload_date = datetime.now(timezone.utc).replace(tzinfo=None)
+
     if isinstance(data, list):
         # If multiple records, process first one
         data = data[0]
@@ -387,7 +483,7 @@ def standardize_health_data(data, filename):
         'additionalNotes': '',
         'metadata': {
             'filename': filename,
-            'uploadDate': datetime.utcnow(),
+            'uploadDate': upload_date,
             'originalFormat': os.path.splitext(filename)[1].lower()
         }
     }
@@ -419,6 +515,8 @@ def handle_preflight():
 if __name__ == '__main__':
     try:
         logger.info("Starting Flask server...")
-        app.run(debug=True, host='0.0.0.0', port=8000)
+        # Development server only; run under gunicorn in production.
+        # Flask reads FLASK_DEBUG itself when debug isn't passed.
+        app.run(host='0.0.0.0', port=8000)
     except Exception as e:
         logger.error(f"Failed to start server: {str(e)}")
\ No newline at end of file
@@ -1,101 +1,109 @@
-import random
 import json
-from datetime import datetime, timedelta
+import orjson
+from datetime import datetime
 import numpy as np
 
-def generate_sleep_stages():
-    # Generate realistic sleep stage percentages that sum to 100%
-    total = 100.0
-    awake = round(random.uniform(5, 10), 1)
-    light = round(random.uniform(45, 55), 1)
-    deep = round(random.uniform(15, 25), 1)
-    rem = round(total - (awake + light + deep), 1)  # Ensure total is 100%
-    
-    total_sleep_hours = random.uniform(6, 9)
-    
-    # Convert percentages to hours and minutes
+def generate_dataset(num_samples=1000, num_users=50):
+    """
+    Generate a dataset with multiple samples per user over time.
+    Every field is drawn as a whole column at once; records are only
+    assembled as dicts at the end.
+    """
+    rng = np.random.default_rng()
+
+    # Random number of samples per user
+    user_samples = rng.integers(15, 26, size=num_users)
+    user_ids = np.repeat(np.arange(1, num_users + 1), user_samples)
+    n = user_ids.size
+
+    timestamps = np.datetime64(datetime.now(), 'us') - rng.integers(0, 31, n).astype('timedelta64[D]')
+
+    # Vital signs
+    systolic = rng.integers(90, 141, n)
+    diastolic = rng.integers(60, 91, n)
+    oxygen = rng.uniform(95, 100, n).round(1)
+    pulse = rng.integers(60, 101, n)
+    temperature = rng.uniform(36.1, 37.2, n).round(1)
+
+    # Sleep stages as percentages that sum to 100%, converted to hours and minutes
+    awake = rng.uniform(5, 10, n).round(1)
+    light = rng.uniform(45, 55, n).round(1)
+    deep = rng.uniform(15, 25, n).round(1)
+    rem = (100.0 - (awake + light + deep)).round(1)
+    total_sleep_hours = rng.uniform(6, 9, n)
+    sleep_quality = rng.integers(5, 11, n)
+
     def percentage_to_time(percentage):
-        hours = int((percentage/100) * total_sleep_hours)
-        minutes = int(((percentage/100) * total_sleep_hours % 1) * 60)
-        return {"Hours": hours, "Minutes": minutes}
-    
-    return {
-        "Time Awake": percentage_to_time(awake),
-        "Light Sleep": percentage_to_time(light),
-        "Deep Sleep": percentage_to_time(deep),
-        "REM Sleep": percentage_to_time(rem),
-        "Total Sleep Time": round(total_sleep_hours, 1),
-        "Sleep Quality Score": random.randint(5, 10)
-    }
+        stage_hours = percentage / 100 * total_sleep_hours
+        return stage_hours.astype(int), (stage_hours % 1 * 60).astype(int)
 
-def generate_body_composition():
-    # Generate realistic body composition data
-    height = random.uniform(150, 190)  # cm
-    weight = random.uniform(50, 100)   # kg
-    bmi = round(weight / ((height/100) ** 2), 1)
-    
-    # Determine BMI category and description
-    if bmi < 18.5:
-        category = "Underweight"
-        description = "Below healthy weight range"
-    elif 18.5 <= bmi < 25:
-        category = "Athletic Build"
-        description = "High muscle mass, healthy body fat"
-    elif 25 <= bmi < 30:
-        category = "Overweight"
-        description = "Above healthy weight range"
-    else:
-        category = "Obese"
-        description = "Significantly above healthy weight range"
-    
-    return {
-        "Height": round(height, 1),
-        "Weight": round(weight, 1),
-        "Body Fat": round(random.uniform(10, 30), 1),
-        "Muscle Mass": round(random.uniform(30, 45), 1),
-        "Body Water": round(random.uniform(50, 65), 1),
-        "Bone Mass": round(random.uniform(2, 4), 1),
-        "BMI": bmi,
-        "Category": category,
-        "Description": description
-    }
+    stages = [percentage_to_time(p) for p in (awake, light, deep, rem)]
 
-def generate_vital_signs():
-    return {
-        "Blood Pressure": {
-            "Systolic": random.randint(90, 140),
-            "Diastolic": random.randint(60, 90)
-        },
-        "Oxygen Saturation": round(random.uniform(95, 100), 1),
-        "Pulse Rate": random.randint(60, 100),
-        "Temperature": round(random.uniform(36.1, 37.2), 1)
-    }
+    # Body composition
+    height = rng.uniform(150, 190, n)
+    weight = rng.uniform(50, 100, n)
+    bmi = (weight / (height / 100) ** 2).round(1)
+    bmi_bins = [bmi < 18.5, bmi < 25, bmi < 30]
+    category = np.select(bmi_bins, ["Underweight", "Athletic Build", "Overweight"], "Obese")
+    description = np.select(bmi_bins, [
+        "Below healthy weight range",
+        "High muscle mass, healthy body fat",
+        "Above healthy weight range"
+    ], "Significantly above healthy weight range")
+    body_fat = rng.uniform(10, 30, n).round(1)
+    muscle_mass = rng.uniform(30, 45, n).round(1)
+    body_water = rng.uniform(50, 65, n).round(1)
+    bone_mass = rng.uniform(2, 4, n).round(1)
 
-def generate_health_record(user_id=None):
-    timestamp = datetime.now() - timedelta(days=random.randint(0, 30))
-    
-    return {
-        "user_id": user_id or random.randint(1000, 9999),
-        "timestamp": timestamp.isoformat(),
-        "vital_signs": generate_vital_signs(),
-        "sleep_data": generate_sleep_stages(),
-        "body_composition": generate_body_composition()
-    }
+    # Sort by timestamp, then materialize records
+    order = np.argsort(timestamps, kind='stable')
+    columns = [
+        user_ids, np.datetime_as_string(timestamps, unit='us'),
+        systolic, diastolic, oxygen, pulse, temperature,
+        *(part for stage in stages for part in stage),
+        total_sleep_hours.round(1), sleep_quality,
+        height.round(1), weight.round(1), body_fat, muscle_mass,
+        body_water, bone_mass, bmi, category, description
+    ]
 
-def generate_dataset(num_samples=1000, num_users=50):
-    """
-    Generate a dataset with multiple samples per user over time
-    """
     dataset = []
-    for user_id in range(1, num_users + 1):
-        # Generate random number of samples per user
-        user_samples = random.randint(15, 25)
-        for _ in range(user_samples):
-            record = generate_health_record(user_id)
-            dataset.append(record)
-    
-    # Sort by timestamp
-    dataset.sort(key=lambda x: x['timestamp'])
+    for (user_id, timestamp, sys_bp, dia_bp, spo2, pulse_rate, temp,
+         awake_h, awake_m, light_h, light_m, deep_h, deep_m, rem_h, rem_m,
+         total_sleep, quality, h, w, fat, muscle, water, bone, b, cat, desc
+         ) in zip(*(column[order].tolist() for column in columns)):
+        dataset.append({
+            "user_id": user_id,
+            "timestamp": timestamp,
+            "vital_signs": {
+                "Blood Pressure": {
+                    "Systolic": sys_bp,
+                    "Diastolic": dia_bp
+                },
+                "Oxygen Saturation": spo2,
+                "Pulse Rate": pulse_rate,
+                "Temperature": temp
+            },
+            "sleep_data": {
+                "Time Awake": {"Hours": awake_h, "Minutes": awake_m},
+                "Light Sleep": {"Hours": light_h, "Minutes": light_m},
+                "Deep Sleep": {"Hours": deep_h, "Minutes": deep_m},
+                "REM Sleep": {"Hours": rem_h, "Minutes": rem_m},
+                "Total Sleep Time": total_sleep,
+                "Sleep Quality Score": quality
+            },
+            "body_composition": {
+                "Height": h,
+                "Weight": w,
+                "Body Fat": fat,
+                "Muscle Mass": muscle,
+                "Body Water": water,
+                "Bone Mass": bone,
+                "BMI": b,
+                "Category": cat,
+                "Description": desc
+            }
+        })
+
     return dataset
 
 if __name__ == "__main__":
@@ -104,8 +112,8 @@ if __name__ == "__main__":
     
     # Save to file
     output_file = "health_data_samples.json"
-    with open(output_file, 'w') as f:
-        json.dump(data, f, indent=2)
+    with open(output_file, 'wb') as f:
+        f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY))
     
     print(f"Generated {len(data)} health records and saved to {output_file}")
     print("Sample record:")
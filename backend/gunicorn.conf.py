@@ -0,0 +1,11 @@
+import multiprocessing
+
+# Production server settings: gunicorn -c gunicorn.conf.py app:app
+bind = '0.0.0.0:8000'
+workers = multiprocessing.cpu_count()
+worker_class = 'gthread'
+threads = 4
+
+# The app is not preloaded: each worker imports it after the fork, so its
+# MongoDB clients and embedding model are never shared across processes
+preload_app = False
@@ -1,5 +1,7 @@
 from pymongo import MongoClient
 import json
+import orjson
+import numpy as np
 from datetime import datetime
 from dotenv import load_dotenv
 import os
@@ -19,12 +21,16 @@ def load_data_to_mongodb(mongodb_uri):
         collection = db['health_records']
         
         # Read the JSON file
-        with open('health_data_samples.json', 'r') as file:
-            health_records = json.load(file)
-        
-        # Convert string timestamps to datetime objects
-        for record in health_records:
-            record['timestamp'] = datetime.fromisoformat(record['timestamp'])
+        with open('health_data_samples.json', 'rb') as file:
+            health_records = orjson.loads(file.read())
+        
+        # Convert string timestamps to datetime objects in one NumPy parse
+        timestamps = np.array(
+            [record['timestamp'] for record in health_records],
+            dtype='datetime64[us]'
+        ).astype(object)
+        for record, timestamp in zip(health_records, timestamps):
+            record['timestamp'] = timestamp
         
         # Create an index on user_id and timestamp for better query performance
         collection.create_index([('user_id', 1), ('timestamp', -1)])
@@ -1,10 +1,19 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional
 import numpy as np
 from datetime import datetime
-import pandas as pd
-from sklearn.linear_model import LinearRegression
+from operator import itemgetter
 import logging
 
+try:
+    from numba import njit
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+# Severity labels indexed by the codes returned from _decline_kernel
+DECLINE_SEVERITIES = ('rapid', 'moderate', 'slow', 'stable', 'unknown')
+RISK_TRAJECTORY_KEYS = ('overall_risk', 'cognitive_risk', 'genetic_risk', 'lifestyle_risk')
+
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
@@ -29,14 +38,26 @@ class LongitudinalAnalysis:
             }
         }
 
+        # Threshold rows aligned with cognitive_metrics; NaN where none apply
+        self._threshold_matrix = np.array([
+            [
+                self.progression_thresholds[metric]['rapid_decline'],
+                self.progression_thresholds[metric]['moderate_decline'],
+                self.progression_thresholds[metric]['slow_decline']
+            ] if metric in self.progression_thresholds else [np.nan] * 3
+            for metric in self.cognitive_metrics
+        ], dtype=np.float64)
+
     def analyze_progression(self, patient_history: List[Dict[str, Any]]) -> Dict[str, Any]:
         """Analyze disease progression from patient history"""
         try:
-            # Sort records by timestamp
-            sorted_history = sorted(
-                patient_history,
-                key=lambda x: datetime.fromisoformat(x['timestamp'])
+            # Parse each timestamp once and sort records by it
+            dated_history = sorted(
+                ((datetime.fromisoformat(record['timestamp']), record) for record in patient_history),
+                key=itemgetter(0)
             )
+            record_times = [timestamp for timestamp, _ in dated_history]
+            sorted_history = [record for _, record in dated_history]
 
             if len(sorted_history) < 2:
                 return {
@@ -45,10 +66,10 @@ class LongitudinalAnalysis:
                 }
 
             analysis = {
-                "cognitive_decline_rate": self._analyze_cognitive_decline(sorted_history),
+                "cognitive_decline_rate": self._analyze_cognitive_decline(sorted_history, record_times),
                 "symptom_progression": self._analyze_symptom_progression(sorted_history),
-                "risk_trajectory": self._analyze_risk_trajectory(sorted_history),
-                "prediction": self._predict_progression(sorted_history)
+                "risk_trajectory": self._analyze_risk_trajectory(sorted_history, record_times),
+                "prediction": self._predict_progression(sorted_history, record_times)
             }
 
             return {
@@ -61,40 +82,26 @@ class LongitudinalAnalysis:
             logger.error(f"Error in progression analysis: {str(e)}")
             return {"status": "error", "message": str(e)}
 
-    def _analyze_cognitive_decline(self, history: List[Dict]) -> Dict[str, Any]:
+    def _analyze_cognitive_decline(self, history: List[Dict], record_times: List[datetime]) -> Dict[str, Any]:
         """Analyze rate of cognitive decline"""
-        decline_rates = {}
-        
-        for metric in self.cognitive_metrics:
-            scores = []
-            timestamps = []
-            
-            for record in history:
-                try:
-                    score = float(record['patient_data']['cognitive_tests'][metric].split()[0])
-                    scores.append(score)
-                    timestamps.append(datetime.fromisoformat(record['timestamp']))
-                except (KeyError, ValueError, AttributeError):
-                    continue
-
-            if len(scores) >= 2:
-                # Convert timestamps to years from first assessment
-                years = [(t - timestamps[0]).days / 365.25 for t in timestamps]
-                
-                # Calculate rate of change
-                if len(scores) == 2:
-                    rate = (scores[-1] - scores[0]) / years[-1]
-                else:
-                    # Use linear regression for more points
-                    reg = LinearRegression().fit(
-                        np.array(years).reshape(-1, 1),
-                        np.array(scores)
-                    )
-                    rate = reg.coef_[0]
+        # One row of scores per metric, NaN where a record lacks a usable value
+        scores = np.full((len(self.cognitive_metrics), len(history)), np.nan)
+        for i, record in enumerate(history):
+            cognitive_tests = record.get('patient_data', {}).get('cognitive_tests', {})
+            for m, metric in enumerate(self.cognitive_metrics):
+                score = _parse_score(cognitive_tests.get(metric))
+                if score is not None:
+                    scores[m, i] = score
+
+        seconds = np.array([(t - record_times[0]).total_seconds() for t in record_times])
+        rates, counts, severities = _decline_kernel(seconds, scores, self._threshold_matrix)
 
+        decline_rates = {}
+        for m, metric in enumerate(self.cognitive_metrics):
+            if counts[m] >= 2:
                 decline_rates[metric] = {
-                    "rate": rate,
-                    "severity": self._classify_decline_rate(metric, rate)
+                    "rate": float(rates[m]),
+                    "severity": DECLINE_SEVERITIES[severities[m]]
                 }
 
         return decline_rates
@@ -121,23 +128,17 @@ class LongitudinalAnalysis:
 
         return symptom_progression
 
-    def _analyze_risk_trajectory(self, history: List[Dict]) -> Dict[str, Any]:
+    def _analyze_risk_trajectory(self, history: List[Dict], record_times: List[datetime]) -> Dict[str, Any]:
         """Analyze how risk factors change over time"""
         risk_scores = []
         timestamps = []
         
-        for record in history:
-            try:
-                risk_assessment = record['risk_assessment']
-                risk_scores.append({
-                    'overall_risk': risk_assessment['overall_risk'],
-                    'cognitive_risk': risk_assessment['cognitive_risk'],
-                    'genetic_risk': risk_assessment['genetic_risk'],
-                    'lifestyle_risk': risk_assessment['lifestyle_risk']
-                })
-                timestamps.append(datetime.fromisoformat(record['timestamp']))
-            except KeyError:
+        for record, timestamp in zip(history, record_times):
+            risk_assessment = record.get('risk_assessment', {})
+            if not all(key in risk_assessment for key in RISK_TRAJECTORY_KEYS):
                 continue
+            risk_scores.append({key: risk_assessment[key] for key in RISK_TRAJECTORY_KEYS})
+            timestamps.append(timestamp)
 
         if not risk_scores:
             return {"status": "no_risk_data"}
@@ -162,20 +163,20 @@ class LongitudinalAnalysis:
 
         return trends
 
-    def _predict_progression(self, history: List[Dict]) -> Dict[str, Any]:
+    def _predict_progression(self, history: List[Dict], record_times: List[datetime]) -> Dict[str, Any]:
         """Predict disease progression based on historical data"""
         try:
             # Extract MMSE scores and timestamps
             mmse_scores = []
             timestamps = []
             
-            for record in history:
-                try:
-                    score = float(record['patient_data']['cognitive_tests']['mmse_score'].split()[0])
-                    mmse_scores.append(score)
-                    timestamps.append(datetime.fromisoformat(record['timestamp']))
-                except (KeyError, ValueError, AttributeError):
+            for record, timestamp in zip(history, record_times):
+                cognitive_tests = record.get('patient_data', {}).get('cognitive_tests', {})
+                score = _parse_score(cognitive_tests.get('mmse_score'))
+                if score is None:
                     continue
+                mmse_scores.append(score)
+                timestamps.append(timestamp)
 
             if len(mmse_scores) < 2:
                 return {"status": "insufficient_data"}
@@ -184,49 +185,44 @@ class LongitudinalAnalysis:
             years = np.array([(t - timestamps[0]).days / 365.25 for t in timestamps])
             scores = np.array(mmse_scores)
 
-            # Fit linear regression
-            reg = LinearRegression().fit(years.reshape(-1, 1), scores)
+            # Fit linear trend
+            slope = self._linear_slope(years, scores)
+            intercept = scores.mean() - slope * years.mean()
+
+            # R-squared from the residuals of the same fit
+            ss_res = ((scores - (slope * years + intercept)) ** 2).sum()
+            ss_tot = ((scores - scores.mean()) ** 2).sum()
+            if ss_tot > 0:
+                r2 = 1 - ss_res / ss_tot
+            else:
+                r2 = 1.0 if ss_res == 0 else 0.0
             
             # Predict next year
-            next_year = np.array([[years[-1] + 1]])
-            predicted_score = reg.predict(next_year)[0]
+            predicted_score = slope * (years[-1] + 1) + intercept
 
             return {
                 "status": "success",
                 "current_score": scores[-1],
                 "predicted_score_1year": predicted_score,
-                "confidence": self._calculate_prediction_confidence(reg, years, scores)
+                "confidence": self._calculate_prediction_confidence(r2, len(years))
             }
 
         except Exception as e:
             logger.error(f"Error in progression prediction: {str(e)}")
             return {"status": "error", "message": str(e)}
 
-    def _classify_decline_rate(self, metric: str, rate: float) -> str:
-        """Classify the rate of decline for a given metric"""
-        if metric not in self.progression_thresholds:
-            return "unknown"
-
-        thresholds = self.progression_thresholds[metric]
-        
-        if rate <= thresholds['rapid_decline']:
-            return "rapid"
-        elif rate <= thresholds['moderate_decline']:
-            return "moderate"
-        elif rate <= thresholds['slow_decline']:
-            return "slow"
-        else:
-            return "stable"
+    def _linear_slope(self, x: np.ndarray, y: np.ndarray) -> float:
+        """Least-squares slope of y against x (0.0 when x has no spread)"""
+        x_centered = x - x.mean()
+        variance = (x_centered ** 2).sum()
+        if variance == 0:
+            return 0.0
+        return float((x_centered * (y - y.mean())).sum() / variance)
 
-    def _calculate_prediction_confidence(self, model: LinearRegression,
-                                      X: np.ndarray, y: np.ndarray) -> float:
+    def _calculate_prediction_confidence(self, r2: float, n_points: int) -> float:
         """Calculate confidence in prediction based on model fit"""
         try:
-            # Use R-squared as base confidence
-            r2 = model.score(X.reshape(-1, 1), y)
-            
-            # Adjust confidence based on number of data points
-            n_points = len(X)
+            # Use R-squared as base confidence, adjusted for number of data points
             if n_points < 3:
                 confidence = r2 * 0.6  # Low confidence with few points
             elif n_points < 5:
@@ -274,3 +270,79 @@ class LongitudinalAnalysis:
                 )
 
         return recommendations
+
+
+def _parse_score(raw) -> Optional[float]:
+    """Leading number of a score such as 23 or "10 words"; None if absent or non-numeric."""
+    if isinstance(raw, (int, float)) and not isinstance(raw, bool):
+        return float(raw)
+    if not isinstance(raw, str):
+        return None
+    parts = raw.split()
+    if not parts:
+        return None
+    try:
+        return float(parts[0])
+    except ValueError:
+        return None
+
+
+def _decline_kernel(seconds, scores, thresholds):
+    """Least-squares decline rate and severity code for each metric row.
+
+    Years are whole days from each metric's first valid assessment, divided
+    by 365.25; NaN scores are skipped.
+    """
+    n_metrics, n_points = scores.shape
+    rates = np.zeros(n_metrics)
+    counts = np.zeros(n_metrics, dtype=np.int64)
+    severities = np.full(n_metrics, 4, dtype=np.int64)
+
+    for m in range(n_metrics):
+        first = 0.0
+        count = 0
+        sum_x = 0.0
+        sum_y = 0.0
+        for i in range(n_points):
+            if not np.isnan(scores[m, i]):
+                if count == 0:
+                    first = seconds[i]
+                count += 1
+                sum_x += np.floor((seconds[i] - first) / 86400.0) / 365.25
+                sum_y += scores[m, i]
+
+        counts[m] = count
+        if count < 2:
+            continue
+
+        mean_x = sum_x / count
+        mean_y = sum_y / count
+        covariance = 0.0
+        variance = 0.0
+        for i in range(n_points):
+            if not np.isnan(scores[m, i]):
+                x = np.floor((seconds[i] - first) / 86400.0) / 365.25 - mean_x
+                covariance += x * (scores[m, i] - mean_y)
+                variance += x * x
+        rate = covariance / variance if variance > 0 else 0.0
+        rates[m] = rate
+
+        if np.isnan(thresholds[m, 0]):
+            severities[m] = 4
+        elif rate <= thresholds[m, 0]:
+            severities[m] = 0
+        elif rate <= thresholds[m, 1]:
+            severities[m] = 1
+        elif rate <= thresholds[m, 2]:
+            severities[m] = 2
+        else:
+            severities[m] = 3
+
+    return rates, counts, severities
+
+
+if NUMBA_AVAILABLE:
+    _decline_kernel = njit(cache=True)(_decline_kernel)
+
+    # Compile at import so the first analysis doesn't pay the JIT cost
+    _decline_kernel(np.zeros(0), np.zeros((0, 0)), np.zeros((0, 3)))
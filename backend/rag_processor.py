@@ -1,11 +1,17 @@
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator
 import numpy as np
+import torch
 from sentence_transformers import SentenceTransformer
+from bson.binary import Binary, BinaryVectorDtype
 from pymongo import MongoClient
+from pymongo.errors import OperationFailure, PyMongoError
+from pymongo.operations import SearchIndexModel
 import os
 from dotenv import load_dotenv
 import logging
-from sklearn.metrics.pairwise import cosine_similarity
+import threading
+import time
+from cachetools import LRUCache
 import json
 
 # Configure logging
@@ -15,18 +21,144 @@ logger = logging.getLogger(__name__)
 # Load environment variables
 load_dotenv()
 
+# Max mean absolute cosine similarity error allowed for int8 embeddings
+QUANTIZATION_TOLERANCE = 0.01
+QUANTIZATION_EVAL_SAMPLES = 64
+# Rows of int8 embeddings dequantized at a time when scoring a query
+SCORE_BLOCK_ROWS = 4096
+
+# Version 2 stores vectors as BSON float32 vectors; version 1 used lists of doubles
+VECTOR_SCHEMA_VERSION = 2
+
+# Seconds between checks of whether a building Atlas search index is queryable
+VECTOR_SEARCH_POLL_SECONDS = 30
+
+
+def decode_vector(value) -> np.ndarray:
+    """Read a stored vector in either the BSON float32 or the legacy list format."""
+    if isinstance(value, Binary):
+        # BSON vector layout: dtype byte, padding byte, then little-endian float32 data
+        return np.frombuffer(value, dtype='<f4', offset=2)
+    return np.asarray(value, dtype=np.float32)
+
+
+def quantize_int8(vectors: np.ndarray):
+    """Quantize each row to int8 with its own scale factor."""
+    scales = np.max(np.abs(vectors), axis=1) / 127
+    scales[scales == 0] = 1.0
+    quantized = np.round(vectors / scales[:, None]).astype(np.int8)
+    return quantized, scales.astype(np.float32)
+
+
+class VectorIndex:
+    """In-memory cosine similarity index over stored chunk vectors."""
+
+    def __init__(self, docs: List[Dict], vectors: np.ndarray, quantize: bool = True):
+        self.docs = docs
+        self.scales = None
+
+        # Normalize rows so cosine similarity is a plain dot product
+        if len(docs):
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1.0
+            vectors = vectors / norms
+        self.matrix = vectors
+
+        if quantize and len(docs):
+            quantized, scales = quantize_int8(vectors)
+            error = self._quantization_error(vectors, quantized, scales)
+            if error <= QUANTIZATION_TOLERANCE:
+                self.matrix, self.scales = quantized, scales
+            else:
+                logger.info(f"Keeping FP32 embeddings, int8 similarity error {error:.4f} too high")
+
+    def similarities(self, query_embedding: np.ndarray) -> np.ndarray:
+        """Cosine similarity of the query against every stored vector."""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query = query / np.linalg.norm(query)
+
+        if self.scales is None:
+            return self.matrix @ query
+
+        # Dequantize one cache-sized block at a time and score it with a BLAS
+        # float32 product against the unquantized query, then apply row scales
+        scores = np.empty(len(self.matrix), dtype=np.float32)
+        for start in range(0, len(self.matrix), SCORE_BLOCK_ROWS):
+            block = self.matrix[start:start + SCORE_BLOCK_ROWS].astype(np.float32)
+            scores[start:start + SCORE_BLOCK_ROWS] = block @ query
+        return scores * self.scales
+
+    @staticmethod
+    def _quantization_error(vectors: np.ndarray, quantized: np.ndarray, scales: np.ndarray) -> float:
+        """Mean absolute similarity error of int8 rows, using stored rows as queries."""
+        rng = np.random.default_rng(0)
+        sample = rng.choice(len(vectors), size=min(len(vectors), QUANTIZATION_EVAL_SAMPLES), replace=False)
+        exact = vectors[sample] @ vectors.T
+        approx = (vectors[sample] @ quantized.T.astype(np.float32)) * scales
+        return float(np.mean(np.abs(exact - approx)))
+
+
 class RAGProcessor:
+    # Model and MongoDB client are shared by every instance in the process
+    _model = None
+    _mongo_client = None
+    _shared_lock = threading.Lock()
+
     def __init__(self):
-        self.model = SentenceTransformer('all-MiniLM-L6-v2')
+        self.model = self._get_model()
+        self.encode_batch_size = 64
+
+        # Recently seen query strings and their embeddings
+        self._query_embeddings = LRUCache(maxsize=1024)
+        self._query_embeddings_lock = threading.Lock()
         self.chunk_size = 500  # characters per chunk
         self.chunk_overlap = 50  # character overlap between chunks
         
         # Initialize MongoDB connection
-        self.mongo_client = self._get_database_connection()
+        self.mongo_client = self._get_mongo_client()
         self.db = self.mongo_client['Health_Framework']
         self.vector_collection = self.db['Vector_Store']
 
-    def _get_database_connection(self) -> MongoClient:
+        # Server-side ANN search on MongoDB Atlas, if the deployment supports it
+        self.vector_search_index = os.getenv('VECTOR_SEARCH_INDEX', 'vector_index')
+        self.vector_search_available = self._ensure_vector_search_index()
+        # Atlas builds new indexes asynchronously and returns no results until
+        # they are queryable, so the local index serves queries until then
+        self._vector_search_ready = False
+        self._vector_search_checked = None
+
+        # Local similarity index over the vector store, rebuilt after new vectors are stored;
+        # the generation stops an index loaded before a store from being kept after it,
+        # and the loaded document count catches stores made by other processes
+        self.quantize_embeddings = True
+        self._index = None
+        self._index_size = 0
+        self._index_generation = 0
+        self._index_lock = threading.Lock()
+
+    @classmethod
+    def _get_model(cls) -> SentenceTransformer:
+        """Load the embedding model once per process."""
+        with cls._shared_lock:
+            if cls._model is None:
+                # Half precision on GPU; CPU inference stays in FP32
+                device = 'cuda' if torch.cuda.is_available() else 'cpu'
+                model = SentenceTransformer('all-MiniLM-L6-v2', device=device)
+                if device == 'cuda':
+                    model.half()
+                cls._model = model
+            return cls._model
+
+    @classmethod
+    def _get_mongo_client(cls) -> MongoClient:
+        """Connect to MongoDB once per process."""
+        with cls._shared_lock:
+            if cls._mongo_client is None:
+                cls._mongo_client = cls._get_database_connection()
+            return cls._mongo_client
+
+    @staticmethod
+    def _get_database_connection() -> MongoClient:
         """Establish connection to MongoDB."""
         uri = os.getenv('MONGODB_URI')
         password = os.getenv('MONGODB_PASSWORD')
@@ -37,10 +169,14 @@ class RAGProcessor:
         uri = uri.replace('<password>', password)
         
         try:
+            # Vectors are derived data, so acknowledge writes from the primary
+            # only; compression falls back to zlib if zstd is missing
             client = MongoClient(
                 uri,
                 serverSelectionTimeoutMS=5000,
-                appName='Health_Framework'
+                appName='Health_Framework',
+                compressors='zstd,zlib',
+                w=1
             )
             client.admin.command('ping')
             logger.info("Successfully connected to MongoDB!")
@@ -50,44 +186,75 @@ class RAGProcessor:
             logger.error(f"Failed to connect to MongoDB: {str(e)}")
             raise
 
+    def _ensure_vector_search_index(self) -> bool:
+        """Create the Atlas vector search index if missing; False if unsupported."""
+        try:
+            existing = list(self.vector_collection.list_search_indexes(self.vector_search_index))
+            if not existing:
+                self.vector_collection.create_search_index(SearchIndexModel(
+                    name=self.vector_search_index,
+                    type='vectorSearch',
+                    definition={
+                        'fields': [{
+                            'type': 'vector',
+                            'path': 'vector',
+                            'numDimensions': self.model.get_sentence_embedding_dimension(),
+                            'similarity': 'cosine'
+                        }]
+                    }
+                ))
+                logger.info(f"Created vector search index '{self.vector_search_index}'")
+            return True
+        except OperationFailure as e:
+            logger.info(f"Atlas vector search unavailable, using local index: {str(e)}")
+            return False
+
     def create_chunks(self, text: str) -> List[str]:
         """Split text into chunks using character-based splitting."""
-        chunks = []
-        
         # Convert text to string if it's not already
         if not isinstance(text, str):
             text = json.dumps(text)
         
-        # Split text into chunks
-        start = 0
-        while start < len(text):
-            # Get chunk
-            end = start + self.chunk_size
-            if end > len(text):
-                end = len(text)
-            chunk = text[start:end]
-            
-            # Add chunk to list
-            chunks.append(chunk)
-            
-            # Move to next chunk, considering overlap
-            start = end - self.chunk_overlap
-            
-            # Break if we've reached the end
-            if start >= len(text):
-                break
-        
-        return chunks
+        if len(text) <= self.chunk_size:
+            return [text] if text else []
+
+        # Windows start every (chunk_size - overlap) characters; the last one
+        # ends at the end of the text
+        step = self.chunk_size - self.chunk_overlap
+        return [
+            text[start:start + self.chunk_size]
+            for start in range(0, len(text) - self.chunk_overlap, step)
+        ]
 
     def generate_embeddings(self, texts: List[str]) -> np.ndarray:
         """Generate embeddings for a list of texts."""
         try:
-            embeddings = self.model.encode(texts)
+            # Unit-length embeddings make cosine similarity a plain dot product
+            embeddings = self.model.encode(
+                texts,
+                batch_size=self.encode_batch_size,
+                convert_to_numpy=True,
+                normalize_embeddings=True,
+                show_progress_bar=False
+            )
             return embeddings
         except Exception as e:
             logger.error(f"Error generating embeddings: {str(e)}")
             raise
 
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a single query, reusing the embedding for repeated queries."""
+        with self._query_embeddings_lock:
+            embedding = self._query_embeddings.get(query)
+
+        if embedding is None:
+            embedding = self.generate_embeddings([query])[0]
+            embedding.setflags(write=False)  # shared between callers
+            with self._query_embeddings_lock:
+                self._query_embeddings[query] = embedding
+
+        return embedding
+
     def store_vectors(self, chunks: List[str], metadata: Dict[str, Any] = None) -> bool:
         """Store text chunks and their vectors in MongoDB."""
         try:
@@ -98,14 +265,19 @@ class RAGProcessor:
             for i, (chunk, embedding) in enumerate(zip(chunks, embeddings)):
                 doc = {
                     'text': chunk,
-                    'vector': embedding.tolist(),
-                    'metadata': metadata or {},
+                    'vector': Binary.from_vector(
+                        embedding.astype(np.float32), BinaryVectorDtype.FLOAT32
+                    ),
+                    'metadata': {**(metadata or {}), 'schema_version': VECTOR_SCHEMA_VERSION},
                     'chunk_index': i
                 }
                 documents.append(doc)
             
             # Insert into MongoDB
-            result = self.vector_collection.insert_many(documents)
+            result = self.vector_collection.insert_many(documents, ordered=False)
+            with self._index_lock:
+                self._index_generation += 1
+                self._index = None
             logger.info(f"Successfully stored {len(result.inserted_ids)} vectors")
             return True
             
@@ -117,40 +289,154 @@ class RAGProcessor:
         """Retrieve most similar chunks for a query."""
         try:
             # Generate query embedding
-            query_embedding = self.generate_embeddings([query])[0]
-            
-            # Find similar vectors using cosine similarity
-            similar_docs = []
-            all_docs = list(self.vector_collection.find({}))
-            
-            for doc in all_docs:
-                similarity = cosine_similarity(
-                    [query_embedding], 
-                    [doc['vector']]
-                )[0][0]
-                
-                similar_docs.append({
-                    'text': doc['text'],
-                    'metadata': doc['metadata'],
-                    'similarity': float(similarity)
-                })
-            
-            # Sort by similarity and get top_k
-            similar_docs.sort(key=lambda x: x['similarity'], reverse=True)
-            return similar_docs[:top_k]
+            query_embedding = self.embed_query(query)
+        except Exception as e:
+            logger.error(f"Error retrieving similar chunks: {str(e)}")
+            return []
+
+        return self.retrieve_similar_by_embedding(query_embedding, top_k)
+
+    def retrieve_similar_by_embedding(self, query_embedding: np.ndarray, top_k: int = 3) -> List[Dict]:
+        """Retrieve most similar chunks for an already encoded query."""
+        if self.vector_search_available:
+            try:
+                if self._vector_search_queryable():
+                    return self._vector_search(query_embedding, top_k)
+            except OperationFailure as e:
+                logger.warning(f"Vector search failed, falling back to local index: {str(e)}")
+                self.vector_search_available = False
+            except PyMongoError as e:
+                logger.warning(f"Vector search error, using local index for this query: {str(e)}")
+
+        try:
+            index = self._get_index()
+            if not index.docs:
+                return []
+
+            # Score every stored chunk at once, then select top_k without a full sort
+            similarities = index.similarities(query_embedding)
+            k = min(top_k, similarities.size)
+            if k <= 0:
+                return []
+            top_indices = np.argpartition(-similarities, k - 1)[:k]
+            top_indices = top_indices[np.argsort(-similarities[top_indices])]
+
+            return [
+                {
+                    'text': index.docs[i]['text'],
+                    'metadata': index.docs[i]['metadata'],
+                    'similarity': float(similarities[i])
+                }
+                for i in top_indices
+            ]
             
         except Exception as e:
             logger.error(f"Error retrieving similar chunks: {str(e)}")
             return []
 
+    def _vector_search_queryable(self) -> bool:
+        """Whether the Atlas search index has finished building and can serve queries."""
+        if self._vector_search_ready:
+            return True
+
+        now = time.monotonic()
+        if self._vector_search_checked is not None and now - self._vector_search_checked < VECTOR_SEARCH_POLL_SECONDS:
+            return False
+        self._vector_search_checked = now
+
+        indexes = list(self.vector_collection.list_search_indexes(self.vector_search_index))
+        self._vector_search_ready = bool(indexes) and bool(indexes[0].get('queryable'))
+        if self._vector_search_ready:
+            logger.info(f"Vector search index '{self.vector_search_index}' is queryable")
+        return self._vector_search_ready
+
+    def _vector_search(self, query_embedding: np.ndarray, top_k: int) -> List[Dict]:
+        """Run an approximate nearest-neighbour query with Atlas $vectorSearch."""
+        results = self.vector_collection.aggregate([
+            {
+                '$vectorSearch': {
+                    'index': self.vector_search_index,
+                    'path': 'vector',
+                    'queryVector': np.asarray(query_embedding, dtype=float).tolist(),
+                    'numCandidates': max(100, top_k * 20),
+                    'limit': top_k
+                }
+            },
+            {
+                '$project': {
+                    '_id': 0,
+                    'text': 1,
+                    'metadata': 1,
+                    'score': {'$meta': 'vectorSearchScore'}
+                }
+            }
+        ])
+
+        # Atlas reports cosine scores as (1 + cosine) / 2
+        return [
+            {
+                'text': doc['text'],
+                'metadata': doc['metadata'],
+                'similarity': 2 * doc['score'] - 1
+            }
+            for doc in results
+        ]
+
+    def _get_index(self) -> 'VectorIndex':
+        """Return the in-memory similarity index, reloading it when the store has changed."""
+        # Other workers add vectors without touching this process's index, so
+        # reuse it only while the collection still holds what was loaded
+        stored = self.vector_collection.estimated_document_count()
+        with self._index_lock:
+            if self._index is not None and self._index_size == stored:
+                return self._index
+            generation = self._index_generation
+
+        # Stream only the fields the index needs, keeping vectors apart
+        # from the text and metadata returned with results
+        docs = []
+        vectors = []
+        cursor = self.vector_collection.find(
+            {}, {'_id': 0, 'vector': 1, 'text': 1, 'metadata': 1}
+        ).batch_size(1000)
+        for doc in cursor:
+            vectors.append(decode_vector(doc.pop('vector')))
+            docs.append(doc)
+        vectors = np.array(vectors, dtype=np.float32)
+        index = VectorIndex(docs, vectors, quantize=self.quantize_embeddings)
+
+        # Only keep the index if no vectors were stored while it was loading
+        with self._index_lock:
+            if generation == self._index_generation:
+                self._index = index
+                self._index_size = len(docs)
+        return index
+
+    def _flatten(self, data: Any, prefix: str = '') -> Iterator[str]:
+        """Yield a "path: value" line for every leaf of nested dicts and lists."""
+        if isinstance(data, dict):
+            items = data.items()
+        elif isinstance(data, list):
+            items = enumerate(data)
+        else:
+            yield f"{prefix}: {data}"
+            return
+
+        for key, value in items:
+            yield from self._flatten(value, f"{prefix}.{key}" if prefix else str(key))
+
     def process_health_data(self, health_data: Dict[str, Any]) -> bool:
         """Process health data document and store its vector representations."""
         try:
-            # Convert health data to text representation
-            text = json.dumps(health_data)
-            
-            # Create chunks
-            chunks = self.create_chunks(text)
+            # One "path: value" line per field, windowed together so chunks
+            # keep neighbouring fields as context but carry no JSON syntax
+            if isinstance(health_data, dict):
+                chunks = self.create_chunks("\n".join(self._flatten(health_data)))
+            else:
+                chunks = self.create_chunks(health_data)
+
+            if not chunks:
+                return True
             
             # Store vectors with metadata
             metadata = {
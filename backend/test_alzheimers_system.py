@@ -1,15 +1,24 @@
 import requests
+from requests.adapters import HTTPAdapter
 import json
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Concurrent requests in flight, also used as the session's connection pool size
+MAX_WORKERS = 8
+
 class AlzheimersSystemTester:
     def __init__(self, base_url: str = "http://localhost:5000"):
         self.base_url = base_url
+        # Reuse keep-alive connections across all requests to the server
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=10, pool_maxsize=MAX_WORKERS))
+        self.session.mount('https://', HTTPAdapter(pool_connections=10, pool_maxsize=MAX_WORKERS))
         self.test_patients = self._generate_test_patients()
 
     def _generate_test_patients(self) -> Dict[str, Dict]:
@@ -18,12 +27,12 @@ class AlzheimersSystemTester:
             "high_risk": {
                 "patient_data": {
                     "demographics": {
-                        "age": "75",
+                        "age": 75,
                         "gender": "female",
-                        "education_years": "12"
+                        "education_years": 12
                     },
                     "cognitive_tests": {
-                        "mmse_score": "23",
+                        "mmse_score": 23,
                         "clock_drawing_test": "impaired",
                         "verbal_fluency": "10 words"
                     },
@@ -49,12 +58,12 @@ class AlzheimersSystemTester:
             "moderate_risk": {
                 "patient_data": {
                     "demographics": {
-                        "age": "68",
+                        "age": 68,
                         "gender": "male",
-                        "education_years": "14"
+                        "education_years": 14
                     },
                     "cognitive_tests": {
-                        "mmse_score": "26",
+                        "mmse_score": 26,
                         "clock_drawing_test": "slight impairment",
                         "verbal_fluency": "13 words"
                     },
@@ -80,12 +89,12 @@ class AlzheimersSystemTester:
             "low_risk": {
                 "patient_data": {
                     "demographics": {
-                        "age": "60",
+                        "age": 60,
                         "gender": "female",
-                        "education_years": "18"
+                        "education_years": 18
                     },
                     "cognitive_tests": {
-                        "mmse_score": "29",
+                        "mmse_score": 29,
                         "clock_drawing_test": "normal",
                         "verbal_fluency": "18 words"
                     },
@@ -113,7 +122,7 @@ class AlzheimersSystemTester:
     def test_connection(self) -> bool:
         """Test connection to the server"""
         try:
-            response = requests.get(f"{self.base_url}/api/test-connection")
+            response = self.session.get(f"{self.base_url}/api/test-connection")
             if response.status_code == 200:
                 logger.info("✓ Server connection successful")
                 return True
@@ -130,7 +139,7 @@ class AlzheimersSystemTester:
             raise ValueError(f"Invalid risk level: {risk_level}")
 
         try:
-            response = requests.post(
+            response = self.session.post(
                 f"{self.base_url}/api/health-data",
                 json=self.test_patients[risk_level]
             )
@@ -157,21 +166,28 @@ class AlzheimersSystemTester:
             "Compare cognitive test scores with normal ranges"
         ]
 
-        for query in test_queries:
-            try:
-                response = requests.post(
-                    f"{self.base_url}/api/query",
-                    json={"query": query}
-                )
-                
-                if response.status_code == 200:
-                    result = response.json()
-                    logger.info(f"\nQuery: {query}")
-                    logger.info(f"Results: {json.dumps(result['results'], indent=2)}")
-                else:
-                    logger.error(f"✗ Query failed: {response.status_code}")
-            except Exception as e:
-                logger.error(f"✗ Error running query: {str(e)}")
+        with ThreadPoolExecutor(MAX_WORKERS) as executor:
+            results = list(executor.map(self._run_query, test_queries))
+
+        for query, result in zip(test_queries, results):
+            if result is not None:
+                logger.info(f"\nQuery: {query}")
+                logger.info(f"Results: {json.dumps(result['results'], indent=2)}")
+
+    def _run_query(self, query: str) -> Optional[Dict[str, Any]]:
+        """Send a single query and return the parsed response"""
+        try:
+            response = self.session.post(
+                f"{self.base_url}/api/query",
+                json={"query": query}
+            )
+
+            if response.status_code == 200:
+                return response.json()
+            logger.error(f"✗ Query failed: {response.status_code}")
+        except Exception as e:
+            logger.error(f"✗ Error running query: {str(e)}")
+        return None
 
 def run_tests():
     """Run all system tests"""
@@ -184,10 +200,11 @@ def run_tests():
 
     # Test 2: Process different risk profiles
     risk_levels = ["high_risk", "moderate_risk", "low_risk"]
-    for risk_level in risk_levels:
-        logger.info(f"\nTesting {risk_level} patient profile:")
-        result = tester.submit_patient_data(risk_level)
-        
+    logger.info(f"\nTesting patient profiles: {', '.join(risk_levels)}")
+    with ThreadPoolExecutor(MAX_WORKERS) as executor:
+        results = list(executor.map(tester.submit_patient_data, risk_levels))
+
+    for risk_level, result in zip(risk_levels, results):
         if result:
             # Test 3: Run queries on the processed data
             logger.info(f"\nTesting queries for {risk_level} patient:")
@@ -1,4 +1,5 @@
 from flask import Flask
+from flask.helpers import get_debug_flag
 from flask_cors import CORS
 
 app = Flask(__name__)
@@ -15,4 +16,8 @@ def test():
 if __name__ == '__main__':
     print("Starting Flask server...")
     print("Try accessing: http://127.0.0.1:5000/test")
-    app.run(debug=True, host='127.0.0.1', port=5000)
+    if get_debug_flag():
+        app.run(debug=True, host='127.0.0.1', port=5000)
+    else:
+        from waitress import serve
+        serve(app, host='127.0.0.1', port=5000, threads=8)